@@ -1,66 +1,284 @@
 import os
 from dotenv import load_dotenv
 import streamlit as st
-from PyPDF2 import PdfReader
+import fitz
 import google.generativeai as genai
+from rank_bm25 import BM25Okapi
 import time
-import pytesseract
-from pdf2image import convert_from_bytes
-from PIL import Image
-import io
-
-# Load environment variables
-load_dotenv()
-genai.configure(api_key=os.getenv("GOOGLE_API_KEY"))
+import re
+import hashlib
+import functools
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+import ocr_worker
 
 # Load and display the AI-generated image
 
 
+MODEL_NAME = 'gemini-2.0-flash-exp'
+
+# 150 DPI grayscale is plenty for printed resume text and keeps OCR pixel counts low
+OCR_DPI = 150
+
+# Pages with less extractable text than this are treated as scanned and OCR'd
+MIN_PAGE_TEXT_CHARS = 20
+
+# Limits that keep one upload from tying up the server: page count, OCR raster size
+# (about 15 letter-size pages at OCR_DPI) and OCR wall-clock time in seconds
+MAX_PDF_PAGES = 15
+MAX_OCR_PIXELS = 15 * 1275 * 1650
+OCR_TIMEOUT = 120
+
+
+class ResumeTooLongError(ValueError):
+    """Raised when a PDF exceeds the page or OCR size limits for real-time analysis."""
+
+
+# Seconds between reruns that poll a Gemini call running on a worker thread
+POLL_INTERVAL = 0.5
+
+# Resumes over MAX_RESUME_WORDS are condensed to about CONDENSED_RESUME_WORDS before
+# being sent to Gemini. The header lines (name, contact details), section headings and
+# the first line under each heading are always kept; the rest of the budget goes to the
+# lines most relevant to the job description
+MAX_RESUME_WORDS = 1000
+CONDENSED_RESUME_WORDS = 600
+RESUME_HEADER_LINES = 5
+RESUME_SECTION_HEADINGS = frozenset({
+    "summary", "profile", "objective", "experience", "employment", "education",
+    "skills", "projects", "certifications", "awards", "publications"
+})
+
+# Job description words that are not keywords and would dilute the keyword match score
+KEYWORD_STOPWORDS = frozenset({
+    "a", "an", "and", "are", "as", "at", "be", "by", "for", "from", "has", "have", "in",
+    "is", "it", "its", "of", "on", "or", "our", "that", "the", "their", "this", "to",
+    "we", "will", "with", "you", "your",
+    # Job posting filler
+    "able", "ability", "best", "can", "good", "great", "including", "looking", "must",
+    "need", "needs", "seeking", "should", "strong", "who"
+})
+
+# How long identical resume/job description analyses are served from cache (seconds)
+CACHE_TTL = 3600
+
+@st.cache_resource
+def _ocr_executor():
+    """OCR process pool kept alive across requests so each worker loads Tesseract only once."""
+    # Spawn rather than fork: by now this process runs the server thread, other sessions'
+    # script threads and gRPC-backed Gemini threads, and forking that state can hang children
+    return ProcessPoolExecutor(
+        max_workers=os.cpu_count() or 1,
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=ocr_worker.init_worker
+    )
+
+
+def _terminate_workers(executor):
+    """Shut a process pool down and kill its worker processes, including busy ones."""
+    if hasattr(executor, "terminate_workers"):  # Python 3.14+
+        executor.terminate_workers()
+        return
+    # Before 3.14 there is no public way to stop a running task: Future.cancel() ignores
+    # running calls and shutdown() only waits for them. The worker handles live in the
+    # private _processes map, so read it before shutdown() releases it.
+    processes = list((executor._processes or {}).values())
+    executor.shutdown(wait=False, cancel_futures=True)
+    for process in processes:
+        process.terminate()
+
+
+def _discard_ocr_executor(executor):
+    """Drop the shared OCR pool and kill its workers, e.g. after one hung or crashed."""
+    # Another session may already have replaced this pool; leave the fresh one alone.
+    # (Pools start their workers lazily, so a pool created by this check costs nothing.)
+    if _ocr_executor() is executor:
+        _ocr_executor.clear()
+    # This deliberately kills every worker, not just the stuck one: the pool can't tell
+    # which process runs which page. Pages other sessions have in flight fail with
+    # BrokenProcessPool; that error isn't cached, so re-uploading retries on a fresh pool.
+    _terminate_workers(executor)
+
+
+def _render_page(page):
+    """Render a PDF page to raw 8-bit grayscale pixels: (samples, width, height, stride, dpi)."""
+    pix = page.get_pixmap(dpi=OCR_DPI, colorspace=fitz.csGRAY, alpha=False)
+    return pix.samples, pix.width, pix.height, pix.stride, OCR_DPI
+
+
+@functools.lru_cache(maxsize=16)
+def _tokenize(text):
+    """Lowercased word tokens of text; cached so the ATS checks and keyword score share them."""
+    return frozenset(re.findall(r"\w+", text.lower()))
+
+
+@st.cache_resource
+def get_model():
+    """Load .env, configure Gemini and build its client once per server process, not per rerun."""
+    load_dotenv()
+    genai.configure(api_key=os.getenv("GOOGLE_API_KEY"))
+    return genai.GenerativeModel(MODEL_NAME)
+
+
+@st.cache_resource
+def _analysis_cache():
+    """Completed Gemini analyses shared across sessions: digest -> (timestamp, text)."""
+    return {}
+
+
+def _analysis_key(input_prompt, pdf_text, job_description):
+    return hashlib.sha256("\0".join([input_prompt, pdf_text, job_description]).encode()).hexdigest()
+
+
+@st.cache_resource
+def _gemini_executor():
+    """Threads that run Gemini calls off the Streamlit script thread, shared across sessions."""
+    return ThreadPoolExecutor(max_workers=4)
+
+
+def _generate_and_cache(model, cache, key, contents):
+    """Yield Gemini response chunks; the full text is cached once the stream completes."""
+    chunks = []
+    for chunk in model.generate_content(contents, stream=True):
+        chunks.append(chunk.text)
+        yield chunk.text
+    
+    text = "".join(chunks)
+    if not text:
+        # Not cached, so an empty reply is retried on the next request
+        yield "No response from Gemini API."
+        return
+    
+    # Prune expired entries on insert so the shared cache doesn't grow for the life of
+    # the server; list() snapshots the items while other sessions' threads insert
+    now = time.time()
+    for stale_key, (stamp, _) in list(cache.items()):
+        if now - stamp >= CACHE_TTL:
+            cache.pop(stale_key, None)
+    # Only complete responses are cached, so failed or interrupted calls are retried
+    cache[key] = (now, text)
+
+
+def _drain_stream(stream, chunks):
+    """Collect a response stream into chunks on a worker thread; returns the full text."""
+    for chunk in stream:
+        chunks.append(chunk)
+    return "".join(chunks)
+
+
 class ATSAnalyzer:
     @staticmethod
-    def extract_text_from_pdf(uploaded_file):
-        """Extract text from a PDF resume, with OCR fallback for image-based PDFs."""
-        try:
-            pdf_reader = PdfReader(uploaded_file)
-            text = ""
-            for page in pdf_reader.pages:
-                page_text = page.extract_text() or ""
-                text += page_text
-            
-            # If no text is extracted, try OCR on each page
-            if not text.strip():
-                st.warning("No text detected. Attempting OCR on image-based PDF...")
-                images = convert_from_bytes(uploaded_file.read(), first_page=1, last_page=len(pdf_reader.pages))
-                for image in images:
-                    text += pytesseract.image_to_string(image) + "\n"
-            
-            return text.strip() if text.strip() else None
-        except Exception as e:
-            st.error(f"Error extracting PDF text: {str(e)}")
-            return None
+    @st.cache_data(ttl=CACHE_TTL, show_spinner=False)
+    def extract_text_from_pdf(pdf_bytes):
+        """Extract text from PDF resume bytes with OCR fallback; raises on failure so errors aren't cached."""
+        with fitz.open(stream=pdf_bytes, filetype="pdf") as doc:
+            if doc.page_count > MAX_PDF_PAGES:
+                raise ResumeTooLongError(f"{doc.page_count} pages, the limit is {MAX_PDF_PAGES}.")
+            page_texts = [page.get_text("text") for page in doc]
+        
+            # OCR only the pages that carry little or no extractable text
+            scanned_pages = [
+                number for number, page_text in enumerate(page_texts)
+                if len(page_text.strip()) < MIN_PAGE_TEXT_CHARS
+            ]
+            if scanned_pages:
+                scale = (OCR_DPI / 72) ** 2
+                if sum(doc[number].rect.width * doc[number].rect.height * scale for number in scanned_pages) > MAX_OCR_PIXELS:
+                    raise ResumeTooLongError("its scanned pages are too large to OCR.")
+                st.warning("Little or no text detected on some pages. Attempting OCR on image-based pages...")
+                executor = _ocr_executor()
+                futures = {}
+                try:
+                    deadline = time.monotonic() + OCR_TIMEOUT
+                    # Submit each page as soon as it is rendered so OCR of earlier pages
+                    # overlaps rendering of later ones
+                    for number in scanned_pages:
+                        futures[number] = executor.submit(ocr_worker.ocr_pixels, _render_page(doc[number]))
+                    for number, future in futures.items():
+                        page_texts[number] = future.result(timeout=max(0, deadline - time.monotonic()))
+                except FutureTimeoutError:
+                    # The stuck worker would keep its slot in the shared pool forever
+                    _discard_ocr_executor(executor)
+                    raise ValueError(f"OCR did not finish within {OCR_TIMEOUT} seconds.") from None
+                except BrokenProcessPool:
+                    # A crashed worker breaks the whole pool; start a fresh one next time
+                    _discard_ocr_executor(executor)
+                    raise
+                finally:
+                    # Don't leave queued pages from this upload occupying the shared pool
+                    for future in futures.values():
+                        future.cancel()
+        
+        text = "\n".join(page_texts)
+        return text.strip() if text.strip() else None
 
     @staticmethod
     def perform_ats_checks(pdf_text, job_description):
         """Perform basic ATS compatibility checks and return a score."""
+        # Keyword and section checks are set lookups over the cached token sets
+        pdf_lower = pdf_text.lower()
+        pdf_tokens = _tokenize(pdf_text)
         checks = {
-            "Keywords Present": any(keyword in pdf_text.lower() for keyword in job_description.lower().split()),
-            "No Complex Formatting": not ("table" in pdf_text.lower() or "image" in pdf_text.lower()),
-            "Key Sections": all(section in pdf_text.lower() for section in ["summary", "experience", "education"]),
-            "Readable Length": len(pdf_text.split()) < 1000  # Less than 1000 words
+            "Keywords Present": bool(ATSAnalyzer.match_keywords(pdf_text, job_description)[0]),
+            "No Complex Formatting": "table" not in pdf_lower and "image" not in pdf_lower,
+            "Key Sections": {"summary", "experience", "education"}.issubset(pdf_tokens),
+            "Readable Length": len(pdf_text.split()) < MAX_RESUME_WORDS
         }
         score = sum(checks.values()) / len(checks) * 100
         return score, checks
 
+    @staticmethod
+    def match_keywords(pdf_text, job_description):
+        """Return the job description keywords found in the resume and the match percentage."""
+        # One hash lookup per keyword over the resume's token set, instead of a text scan each
+        jd_tokens = {
+            token for token in _tokenize(job_description)
+            if len(token) > 1 and token not in KEYWORD_STOPWORDS
+        }
+        matched = jd_tokens & _tokenize(pdf_text)
+        percentage = len(matched) / len(jd_tokens) * 100 if jd_tokens else 0.0
+        return matched, percentage
+
+    @staticmethod
+    def condense_resume(pdf_text, job_description):
+        """Trim a long resume to its structure plus the lines most relevant to the job, in order."""
+        if len(pdf_text.split()) <= MAX_RESUME_WORDS:
+            return pdf_text
+        
+        sentences = [
+            sentence for sentence in re.split(r"(?<=[.!?])\s+|\n+", pdf_text)
+            if re.search(r"\w", sentence)
+        ]
+        corpus = [re.findall(r"\w+", sentence.lower()) for sentence in sentences]
+        
+        # Dropping these would make Gemini report missing details that were only trimmed
+        keep = set(range(min(RESUME_HEADER_LINES, len(sentences))))
+        for i, tokens in enumerate(corpus):
+            if len(tokens) <= 4 and RESUME_SECTION_HEADINGS.intersection(tokens):
+                keep.update(j for j in (i, i + 1) if j < len(sentences))
+        words = sum(len(sentences[i].split()) for i in keep)
+        
+        scores = BM25Okapi(corpus).get_scores(list(_tokenize(job_description)))
+        for i in sorted(range(len(sentences)), key=lambda i: scores[i], reverse=True):
+            length = len(sentences[i].split())
+            if i not in keep and words + length <= CONDENSED_RESUME_WORDS:
+                keep.add(i)
+                words += length
+        return "\n".join(sentences[i] for i in sorted(keep))
+
     @staticmethod
     def get_gemini_response(input_prompt, pdf_text, job_description):
-        """Fetch response from Google Gemini API with retries for reliability."""
-        try:
-            model = genai.GenerativeModel('gemini-2.0-flash-exp')
-            response = model.generate_content([input_prompt, pdf_text, job_description])
-            return response.text if response.text else "No response from Gemini API."
-        except Exception as e:
-            st.error(f"Error generating Gemini response: {str(e)}")
-            return None
+        """Return an iterator over the Google Gemini response text, serving repeats from cache."""
+        # Streamlit resources are resolved here, on the script thread; the returned
+        # iterator makes no Streamlit calls and can be consumed from a worker thread
+        cache = _analysis_cache()
+        key = _analysis_key(input_prompt, pdf_text, job_description)
+        cached = cache.get(key)
+        if cached and time.time() - cached[0] < CACHE_TTL:
+            return iter([cached[1]])
+        return _generate_and_cache(get_model(), cache, key, [input_prompt, pdf_text, job_description])
 
 def main():
     # Page configuration
@@ -70,6 +288,9 @@ def main():
         layout="wide"
     )
 
+    # One-time environment and Gemini client setup
+    get_model()
+
     # Header with professional description
     st.title("📄🔍 AI-Powered Resume Analyzer")
    
@@ -151,61 +372,102 @@ def main():
             ["Detailed Resume Review", "ATS Match Percentage Analysis"]
         )
 
+        # An analysis kept in session state is only shown while these inputs are unchanged
+        analysis_inputs = (uploaded_file.file_id, job_description, analysis_type)
+
         if st.button("Analyze Resume"):
             with st.spinner("Analyzing your resume... Please wait"):
-                # Extract PDF text with OCR fallback
-                pdf_text = ATSAnalyzer.extract_text_from_pdf(uploaded_file)
+                # Extract PDF text with OCR fallback; getvalue() reads the upload
+                # without touching its stream position
+                try:
+                    pdf_text = ATSAnalyzer.extract_text_from_pdf(uploaded_file.getvalue())
+                except ResumeTooLongError as e:
+                    st.error(f"Resume too long for real-time analysis: {str(e)}")
+                    return
+                except Exception as e:
+                    st.error(f"Error extracting PDF text: {str(e)}")
+                    return
                 
                 if not pdf_text:
                     st.error("No text could be extracted from the resume. Please check the file or ensure it’s a text-based PDF. For scanned PDFs, OCR is attempted.")
                     return
 
-                # Perform ATS checks
-                ats_score, ats_checks = ATSAnalyzer.perform_ats_checks(pdf_text, job_description)
+            # Perform ATS checks
+            ats_score, ats_checks = ATSAnalyzer.perform_ats_checks(pdf_text, job_description)
 
-                # Display ATS compatibility score
+            # Display ATS compatibility score
+            
+
+            # Prepare Gemini prompt based on analysis type
+            if analysis_type == "Detailed Resume Review":
+                prompt = """
+                As an experienced Technical HR Manager, provide a detailed professional evaluation of the candidate's resume against the job description. Analyze:
+                1. Overall alignment with the role
+                2. Key strengths and qualifications that match
+                3. Notable gaps or areas for improvement
+                4. Specific recommendations for enhancing ATS compatibility and readability
+                5. Final verdict on suitability for the role
                 
+                Format the response with clear headings, bullet points, and professional language.
+                """
+            else:  # ATS Match Percentage Analysis
+                prompt = """
+                As an ATS (Applicant Tracking System) expert, provide:
+                1. Overall match percentage (%)
+                2. Key matching keywords found
+                3. Important missing keywords
+                4. Skills gap analysis
+                5. Specific recommendations for improving ATS compatibility and keyword optimization
+                
+                Start with the percentage match prominently displayed, followed by detailed analysis in bullet points.
+                """
+
+            keyword_match = None
+            if analysis_type == "ATS Match Percentage Analysis":
+                # Local keyword score is instant; Gemini's fuller analysis streams in below
+                _, keyword_match = ATSAnalyzer.match_keywords(pdf_text, job_description)
+
+            # Gemini only sees the most relevant part of long resumes; the local
+            # checks above use the full text
+            resume_context = ATSAnalyzer.condense_resume(pdf_text, job_description)
+
+            # Run Gemini on a worker thread so this session stays responsive; the
+            # reruns below poll the future and show the text streamed so far
+            chunks = []
+            stream = ATSAnalyzer.get_gemini_response(prompt, resume_context, job_description)
+            st.session_state["analysis"] = {
+                "inputs": analysis_inputs,
+                "keyword_match": keyword_match,
+                "chunks": chunks,
+                "future": _gemini_executor().submit(_drain_stream, stream, chunks),
+            }
+
+        analysis = st.session_state.get("analysis")
+        if analysis and analysis["inputs"] == analysis_inputs:
+            if analysis["keyword_match"] is not None:
+                st.metric("Keyword Match (local estimate)", f"{analysis['keyword_match']:.0f}%")
 
-                # Prepare Gemini prompt based on analysis type
-                if analysis_type == "Detailed Resume Review":
-                    prompt = """
-                    As an experienced Technical HR Manager, provide a detailed professional evaluation of the candidate's resume against the job description. Analyze:
-                    1. Overall alignment with the role
-                    2. Key strengths and qualifications that match
-                    3. Notable gaps or areas for improvement
-                    4. Specific recommendations for enhancing ATS compatibility and readability
-                    5. Final verdict on suitability for the role
-                    
-                    Format the response with clear headings, bullet points, and professional language.
-                    """
-                else:  # ATS Match Percentage Analysis
-                    prompt = """
-                    As an ATS (Applicant Tracking System) expert, provide:
-                    1. Overall match percentage (%)
-                    2. Key matching keywords found
-                    3. Important missing keywords
-                    4. Skills gap analysis
-                    5. Specific recommendations for improving ATS compatibility and keyword optimization
-                    
-                    Start with the percentage match prominently displayed, followed by detailed analysis in bullet points.
-                    """
-
-                # Get and display Gemini response
-                response = ATSAnalyzer.get_gemini_response(prompt, pdf_text, job_description)
+            st.markdown("### AI-Powered Analysis Results")
+            future = analysis["future"]
+            if not future.done():
+                st.markdown("".join(analysis["chunks"]))
+                st.caption("⏳ Gemini is still writing the analysis...")
+                time.sleep(POLL_INTERVAL)
+                st.rerun()
+            elif future.exception():
+                st.error(f"Error generating Gemini response: {str(future.exception())}")
+                st.error("Failed to retrieve AI analysis. Please try again later.")
+            else:
+                response = future.result()
+                st.markdown(response)
                 
-                if response:
-                    st.markdown("### AI-Powered Analysis Results")
-                    st.markdown(response)
-                    
-                    # Add export option
-                    st.download_button(
-                        label="📥 Export Analysis",
-                        data=response,
-                        file_name="resume_analysis.txt",
-                        mime="text/plain"
-                    )
-                else:
-                    st.error("Failed to retrieve AI analysis. Please try again later.")
+                # Add export option
+                st.download_button(
+                    label="📥 Export Analysis",
+                    data=response,
+                    file_name="resume_analysis.txt",
+                    mime="text/plain"
+                )
 
     else:
         st.info("👆 Please upload your resume and provide the job description to begin the analysis.")
@@ -0,0 +1,32 @@
+"""Tesseract OCR for worker processes, kept out of app.py so Streamlit reruns can't swap it."""
+import os
+
+# One Tesseract process already runs per core; an OpenMP thread team inside each would
+# oversubscribe the CPU and slow OCR down. Must be set before libtesseract is loaded.
+os.environ.setdefault("OMP_THREAD_LIMIT", "1")
+
+from tesserocr import PyTessBaseAPI, PSM, OEM
+
+# Tesseract engine kept resident in each OCR worker process
+_tess_api = None
+
+
+def init_worker():
+    """Load the Tesseract model once per worker instead of once per page."""
+    global _tess_api
+    # Resumes are single-column English text: skip full layout analysis and the legacy
+    # engine, and use the faster tessdata_fast models when TESSDATA_FAST_DIR points at them
+    options = {"lang": "eng", "psm": PSM.SINGLE_BLOCK, "oem": OEM.LSTM_ONLY}
+    if os.getenv("TESSDATA_FAST_DIR"):
+        options["path"] = os.getenv("TESSDATA_FAST_DIR")
+    _tess_api = PyTessBaseAPI(**options)
+
+
+def ocr_pixels(pixels):
+    """OCR one rendered page given as (samples, width, height, stride, dpi) of 8-bit grayscale."""
+    samples, width, height, stride, dpi = pixels
+    # Raw pixel buffer goes straight to Tesseract, skipping any PIL/PNG encode-decode
+    _tess_api.SetImageBytes(samples, width, height, 1, stride)
+    # Raw bytes carry no resolution; without this Tesseract assumes 70 dpi
+    _tess_api.SetSourceResolution(dpi)
+    return _tess_api.GetUTF8Text()